@@ -1,34 +1,197 @@
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Browser, BrowserContext, Route
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import asyncio
 import json
-from typing import List, Dict, Any
-from urllib.parse import unquote
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
 
-app = FastAPI(title="Cookie Extractor API", version="1.0.0")
+# Limits below are per uvicorn worker. Each worker runs its own Playwright
+# driver and pools, so with WORKERS > 1 a token can see up to
+# WORKERS * MAX_CONC live sessions on the remote browser service.
+MAX_CONC = int(os.getenv("MAX_CONC", "8"))  # extractions in flight per worker
+MAX_BROWSERS = 16  # LRU cap on per-token CDP connections
+POOL_SIZE = MAX_CONC  # contexts per browser; more could never be in use
+MAX_CONTEXT_USES = 20  # requests served before a pooled context is recreated
+COOKIE_WAIT_MS = 10000  # hard cap when polling for an expected cookie
+COOKIE_POLL_MS = 100
+MAX_PARALLEL_NAV = 4  # independent requests loading both URLs at once
+STATE_TTL = 300  # seconds a warmed cookie jar is reused for a base URL
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))  # seconds
+
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+# Matched by the Playwright driver, so only likely candidates reach Python;
+# block_heavy_resources then checks the real resource type
+BLOCKED_RESOURCES = re.compile(
+    r"\.(?:png|jpe?g|gif|webp|avif|svg|ico|bmp"
+    r"|woff2?|ttf|otf|eot"
+    r"|mp4|webm|ogg|mp3|wav|m4a"
+    r"|css)(?:[?#]|$)"
+    r"|//fonts\.(?:googleapis|gstatic)\.com/",
+    re.IGNORECASE,
+)
+
+browser_semaphore = asyncio.BoundedSemaphore(MAX_CONC)
+nav_semaphore = asyncio.Semaphore(MAX_PARALLEL_NAV)
+
+# (token, base netloc) -> (stored at, cookie jar)
+STATE_CACHE: Dict[Tuple[str, str], Tuple[float, list]] = {}
+
+async def block_heavy_resources(route: Route):
+    """Abort resources that never affect the cookie jar"""
+    request = route.request
+    if request.is_navigation_request() or request.resource_type not in BLOCKED_RESOURCE_TYPES:
+        await route.continue_()
+    else:
+        await route.abort()
+
+class ContextPool:
+    """Bounded pool of reusable browser contexts on one CDP browser"""
+
+    def __init__(self, browser: Browser, size: int = POOL_SIZE,
+                 max_uses: int = MAX_CONTEXT_USES):
+        self.browser = browser
+        self.size = size
+        self.max_uses = max_uses
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[BrowserContext] = []
+        self._uses: Dict[BrowserContext, int] = {}
+        self.users = 0  # requests pinned by get_pool; never evicted while > 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a context, creating one lazily until the pool is full"""
+        # The semaphore owns the slot count, so it comes back on any exit,
+        # including cancellation, and a freed slot always wakes a waiter
+        async with self._slots:
+            context = self._idle.pop() if self._idle else await self._new_context()
+            try:
+                yield context
+            finally:
+                await self.release(context)
+
+    async def _new_context(self) -> BrowserContext:
+        context = await self.browser.new_context()
+        try:
+            await context.route(BLOCKED_RESOURCES, block_heavy_resources)
+        except BaseException:
+            await self._discard(context)
+            raise
+        self._uses[context] = 0
+        return context
+
+    async def release(self, context: BrowserContext):
+        """Reset a context and put it back, or drop it if worn out or broken"""
+        self._uses[context] = self._uses.get(context, 0) + 1
+        reset = False
+        try:
+            # The storage wipe only reaches origins still loaded in a frame;
+            # the use cap bounds whatever it misses (redirect hops, beacons)
+            if self._uses[context] < self.max_uses:
+                await self.clear_storage(context)
+                for page in context.pages:
+                    await page.close()
+                await context.clear_cookies()
+                reset = True
+        except Exception:
+            pass
+        finally:
+            if reset:
+                self._idle.append(context)
+            else:
+                await self._discard(context)
+
+    async def clear_storage(self, context: BrowserContext):
+        """Wipe localStorage, IndexedDB, caches and service workers per origin"""
+        origins = set()
+        for page in context.pages:
+            for frame in page.frames:
+                url = urlparse(frame.url)
+                if url.scheme in ("http", "https"):
+                    origins.add(f"{url.scheme}://{url.netloc}")
+        if not origins:
+            return
+
+        session = await context.new_cdp_session(context.pages[0])
+        try:
+            await asyncio.gather(*(
+                session.send("Storage.clearDataForOrigin",
+                             {"origin": origin, "storageTypes": "all"})
+                for origin in origins
+            ))
+        finally:
+            await session.detach()
+
+    async def _discard(self, context: BrowserContext):
+        self._uses.pop(context, None)
+        try:
+            await context.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        try:
+            await self.browser.close()
+        except Exception:
+            pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start Playwright once and share CDP connections across requests"""
+    app.state.playwright = await async_playwright().start()
+    app.state.pools = OrderedDict()  # token -> ContextPool, LRU order
+    app.state.connecting = {}  # token -> Task for an in-progress CDP connect
+    app.state.waiting = {}  # token -> callers awaiting that connect
+    try:
+        yield
+    finally:
+        for task in app.state.connecting.values():
+            task.cancel()
+        for pool in app.state.pools.values():
+            await pool.close()
+        app.state.pools.clear()
+        await app.state.playwright.stop()
+
+app = FastAPI(
+    title="Cookie Extractor API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 class CookieRequest(BaseModel):
     base_url: str
     requested_url: str
     token: str  # USER PROVIDES TOKEN
+    cookie_name: Optional[str] = None  # return as soon as this cookie is set
+    independent: bool = False  # requested_url doesn't need base_url's cookies
 
-class CookieResponse(BaseModel):
-    success: bool
-    cookies: List[Dict[str, Any]]
-    count: int
-    message: str = None
+@lru_cache(maxsize=1024)
+def decode_url(url: str) -> str:
+    return unquote(url)
 
-@app.post("/extract-cookies", response_model=CookieResponse)
+@app.post("/extract-cookies")
 async def extract_cookies(request: CookieRequest):
     """POST: Extract cookies (RECOMMENDED)"""
     try:
-        cookies = await get_cookies(request.base_url, request.requested_url, request.token)
-        return CookieResponse(
-            success=True,
-            cookies=cookies,
-            count=len(cookies)
+        cookies = await get_cookies(
+            request.base_url, request.requested_url, request.token,
+            request.cookie_name, request.independent
         )
+        # Plain dict: skips response_model validation of every cookie
+        return {
+            "success": True,
+            "cookies": cookies,
+            "count": len(cookies),
+            "message": None
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -36,14 +199,16 @@ async def extract_cookies(request: CookieRequest):
 async def extract_cookies_get(
     base_url: str = Query(...),
     requested_url: str = Query(...),
-    token: str = Query(...)
+    token: str = Query(...),
+    cookie_name: Optional[str] = Query(None),
+    independent: bool = Query(False)
 ):
     """GET: Extract cookies"""
     try:
-        base_url = unquote(base_url)
-        requested_url = unquote(requested_url)
+        base_url = decode_url(base_url)
+        requested_url = decode_url(requested_url)
         
-        cookies = await get_cookies(base_url, requested_url, token)
+        cookies = await get_cookies(base_url, requested_url, token, cookie_name, independent)
         
         return {
             "success": True,
@@ -53,24 +218,163 @@ async def extract_cookies_get(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def get_cookies(base_url: str, requested_url: str, token: str) -> list:
-    """Extract cookies after visiting both URLs"""
-    async with async_playwright() as p:
+async def get_pool(token: str) -> ContextPool:
+    """Return the shared context pool for a token, connecting on first use
+
+    The pool comes back pinned (`users` incremented) so eviction can't close
+    it under the caller; pair every call with release_pool().
+    """
+    # Dict access never awaits, so no lock is needed; only the connect does,
+    # and that is shared per token so other tokens are never held up
+    pool = app.state.pools.get(token)
+    if pool is None or not pool.browser.is_connected():
+        task = app.state.connecting.get(token)
+        if task is None:
+            task = app.state.connecting[token] = asyncio.ensure_future(connect_pool(token))
+
+        # Count ourselves as waiting so a connect finishing for another token
+        # can't evict this one before we wake up and pin it
+        waiting = app.state.waiting
+        waiting[token] = waiting.get(token, 0) + 1
+        try:
+            # shield: one caller timing out must not abort the connect for the rest
+            pool = await asyncio.shield(task)
+        finally:
+            waiting[token] -= 1
+            if not waiting[token]:
+                del waiting[token]
+    else:
+        app.state.pools.move_to_end(token)
+
+    pool.users += 1
+    return pool
+
+def release_pool(pool: ContextPool):
+    pool.users -= 1
+
+async def connect_pool(token: str) -> ContextPool:
+    try:
         # USER TOKEN INJECTED HERE!
-        browser = await p.chromium.connect_over_cdp(f"wss://play.kamingo.in?token={token}")
-        context = await browser.new_context()
-        page = await context.new_page()
-        
-        print(f"🌐 Visiting: {base_url}")
-        await page.goto(base_url, wait_until="networkidle")
-        
-        print(f"🌐 Visiting: {requested_url}")
-        await page.goto(requested_url, wait_until="networkidle")
+        browser = await app.state.playwright.chromium.connect_over_cdp(
+            f"wss://play.kamingo.in?token={token}"
+        )
+    finally:
+        app.state.connecting.pop(token, None)
+
+    pools = app.state.pools
+    dropped = [pools.pop(token)] if token in pools else []
+    pool = pools[token] = ContextPool(browser)
+
+    # Evict least recently used pools, skipping any that requests still use
+    for stale_token in list(pools):
+        if len(pools) <= MAX_BROWSERS:
+            break
+        if (stale_token != token and pools[stale_token].users == 0
+                and stale_token not in app.state.waiting):
+            dropped.append(pools.pop(stale_token))
+
+    for stale in dropped:
+        await stale.close()
+    return pool
+
+async def wait_for_cookie(context: BrowserContext, urls: List[str], name: str) -> list:
+    """Poll `urls`' cookies until `name` appears or COOKIE_WAIT_MS runs out
+
+    Callers pass the final page URL alongside the requested one: redirects
+    (e.g. http -> https://www.) land on a host/scheme whose host-only and
+    Secure cookies the input URL alone would filter out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + COOKIE_WAIT_MS / 1000
+    while True:
+        cookies = await context.cookies(urls)
+        if any(c["name"] == name for c in cookies) or loop.time() >= deadline:
+            return cookies
+        await asyncio.sleep(COOKIE_POLL_MS / 1000)
+
+def get_cached_state(key: Tuple[str, str]) -> Optional[list]:
+    """Return a still-fresh cookie jar for a (token, base netloc) pair"""
+    entry = STATE_CACHE.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] >= STATE_TTL:
+        del STATE_CACHE[key]
+        return None
+    return entry[1]
+
+def store_state(key: Tuple[str, str], cookies: list):
+    now = time.monotonic()
+    for stale in [k for k, (ts, _) in STATE_CACHE.items() if now - ts >= STATE_TTL]:
+        del STATE_CACHE[stale]
+    STATE_CACHE[key] = (now, cookies)
+
+async def get_cookies(base_url: str, requested_url: str, token: str,
+                      cookie_name: Optional[str] = None,
+                      independent: bool = False) -> list:
+    """Extract cookies, bounded by MAX_CONC and REQUEST_TIMEOUT"""
+    async with browser_semaphore:
+        try:
+            return await asyncio.wait_for(
+                collect_cookies(base_url, requested_url, token, cookie_name, independent),
+                timeout=REQUEST_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out after {REQUEST_TIMEOUT:g}s extracting cookies for {requested_url}")
+
+async def collect_cookies(base_url: str, requested_url: str, token: str,
+                          cookie_name: Optional[str] = None,
+                          independent: bool = False) -> list:
+    """Extract cookies after visiting base_url, then requested_url
+
+    With `independent`, the caller vouches that requested_url doesn't rely
+    on cookies set by base_url, so both pages are loaded concurrently.
+    """
+    pool = await get_pool(token)
+    try:
+        key = (token, urlparse(base_url).netloc)
+        cached = get_cached_state(key)
+        async with pool.acquire() as context:
+            if cached is not None:
+                # Base URL was visited recently: restore its jar instead of reloading
+                await context.add_cookies(cached)
+                page = await context.new_page()
+            
+                print(f"🌐 Visiting: {requested_url} (cached {base_url})")
+                await page.goto(requested_url, wait_until="domcontentloaded")
+            elif independent:
+                async with nav_semaphore:
+                    base_page, page = await asyncio.gather(context.new_page(), context.new_page())
+                    print(f"🌐 Visiting: {base_url} + {requested_url}")
+                    await asyncio.gather(
+                        base_page.goto(base_url, wait_until="domcontentloaded"),
+                        page.goto(requested_url, wait_until="domcontentloaded"),
+                    )
+            else:
+                page = await context.new_page()
+            
+                print(f"🌐 Visiting: {base_url}")
+                await page.goto(base_url, wait_until="domcontentloaded")
+            
+                print(f"🌐 Visiting: {requested_url}")
+                await page.goto(requested_url, wait_until="domcontentloaded")
         
-        cookies = await context.cookies()
-        await browser.close()
+            if cookie_name:
+                cookies = await wait_for_cookie(context, [requested_url, page.url], cookie_name)
+            else:
+                # No cookie to wait for: fall back to letting late XHRs settle
+                await page.wait_for_load_state("networkidle")
+                # The driver still fetches the whole jar over CDP and filters
+                # locally: this trims the response, not the wire transfer
+                cookies = await context.cookies([requested_url, page.url])
         
-        return cookies
+            if cached is None:
+                # Only a real base visit may (re)start the TTL; hits replay as-is.
+                # Snapshot the whole jar: the base visit may also have set cookies
+                # on redirect, SSO or third-party hosts and on other paths
+                store_state(key, await context.cookies())
+            return cookies
+    finally:
+        release_pool(pool)
 
 @app.get("/")
 async def root():
@@ -83,4 +387,9 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3000)
\ No newline at end of file
+    # loop/http "auto" pick uvloop + httptools whenever they are installed
+    # Work happens on the remote browser, so one async worker is usually
+    # enough; each extra worker multiplies the per-worker limits above
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run("main:app", host="0.0.0.0", port=3000,
+                loop="auto", http="auto", workers=workers)
\ No newline at end of file
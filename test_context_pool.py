@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+
+from main import ContextPool
+
+class StubFrame:
+    def __init__(self, url):
+        self.url = url
+
+class StubPage:
+    def __init__(self, context, *frame_urls):
+        self.context = context
+        self.frames = [StubFrame(url) for url in frame_urls]
+
+    async def close(self):
+        self.context.pages.remove(self)
+
+class StubSession:
+    def __init__(self):
+        self.cleared = []
+        self.detached = False
+
+    async def send(self, method, params):
+        assert method == "Storage.clearDataForOrigin"
+        self.cleared.append(params["origin"])
+
+    async def detach(self):
+        self.detached = True
+
+class StubContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+        self.sessions = []
+        self.closed = False
+
+    async def new_cdp_session(self, page):
+        session = StubSession()
+        self.sessions.append(session)
+        return session
+
+    async def route(self, pattern, handler):
+        await asyncio.sleep(self.browser.route_delay)
+
+    async def clear_cookies(self):
+        if self.browser.fail_reset:
+            raise RuntimeError("browser disconnected")
+
+    async def close(self):
+        self.closed = True
+
+class StubBrowser:
+    def __init__(self):
+        self.new_context_delay = 0
+        self.route_delay = 0
+        self.fail_reset = False
+        self.contexts = []
+
+    async def new_context(self):
+        await asyncio.sleep(self.new_context_delay)
+        context = StubContext(self)
+        self.contexts.append(context)
+        return context
+
+async def borrow(pool):
+    async with pool.acquire() as context:
+        return context
+
+class ContextPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def test_slot_returns_after_cancel_during_new_context(self):
+        browser = StubBrowser()
+        pool = ContextPool(browser, size=1)
+
+        browser.new_context_delay = 1
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(borrow(pool), timeout=0.01)
+
+        browser.new_context_delay = 0
+        context = await asyncio.wait_for(borrow(pool), timeout=1)
+        self.assertFalse(context.closed)
+
+    async def test_half_built_context_closed_on_cancel(self):
+        browser = StubBrowser()
+        pool = ContextPool(browser, size=1)
+
+        browser.route_delay = 1
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(borrow(pool), timeout=0.01)
+        self.assertTrue(browser.contexts[0].closed)
+
+        browser.route_delay = 0
+        await asyncio.wait_for(borrow(pool), timeout=1)
+
+    async def test_failed_reset_wakes_waiter(self):
+        browser = StubBrowser()
+        pool = ContextPool(browser, size=1)
+        holding = asyncio.Event()
+        done = asyncio.Event()
+
+        async def holder():
+            async with pool.acquire():
+                holding.set()
+                await done.wait()
+                browser.fail_reset = True
+
+        task = asyncio.create_task(holder())
+        await holding.wait()
+        waiter = asyncio.create_task(borrow(pool))
+        await asyncio.sleep(0)
+        done.set()
+        await task
+
+        context = await asyncio.wait_for(waiter, timeout=1)
+        self.assertTrue(browser.contexts[0].closed)
+        self.assertIsNot(context, browser.contexts[0])
+
+    async def test_storage_cleared_for_loaded_origins(self):
+        browser = StubBrowser()
+        pool = ContextPool(browser, size=1)
+
+        async with pool.acquire() as context:
+            context.pages.append(StubPage(
+                context, "https://a.com/x", "https://b.com/frame", "about:blank"
+            ))
+
+        session = context.sessions[0]
+        self.assertEqual(sorted(session.cleared), ["https://a.com", "https://b.com"])
+        self.assertTrue(session.detached)
+        self.assertEqual(context.pages, [])
+        self.assertIs(await borrow(pool), context)
+
+    async def test_context_recreated_after_max_uses(self):
+        browser = StubBrowser()
+        pool = ContextPool(browser, size=1, max_uses=2)
+
+        first = await borrow(pool)
+        self.assertIs(await borrow(pool), first)
+        self.assertTrue(first.closed)
+
+        self.assertIsNot(await borrow(pool), first)
+        self.assertEqual(len(browser.contexts), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+import main
+from test_context_pool import StubBrowser
+
+class StubCDPBrowser(StubBrowser):
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def close(self):
+        self.closed = True
+
+class StubChromium:
+    def __init__(self):
+        self.connects = []
+        self.gates = {}  # token -> Event the connect waits on
+
+    async def connect_over_cdp(self, url):
+        token = url.rsplit("=", 1)[1]
+        self.connects.append(token)
+        if token in self.gates:
+            await self.gates[token].wait()
+        return StubCDPBrowser()
+
+class StubPlaywright:
+    def __init__(self):
+        self.chromium = StubChromium()
+
+class GetPoolTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.playwright = StubPlaywright()
+        main.app.state.playwright = self.playwright
+        main.app.state.pools = OrderedDict()
+        main.app.state.connecting = {}
+        main.app.state.waiting = {}
+
+    def gate(self, token):
+        event = self.playwright.chromium.gates[token] = asyncio.Event()
+        return event
+
+    async def test_concurrent_callers_share_one_connect(self):
+        gate = self.gate("a")
+        callers = [asyncio.create_task(main.get_pool("a")) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        pools = await asyncio.gather(*callers)
+
+        self.assertEqual(self.playwright.chromium.connects, ["a"])
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+        self.assertEqual(pools[0].users, 3)
+
+    async def test_connected_token_not_blocked_by_slow_connect(self):
+        ready = await main.get_pool("ready")
+        main.release_pool(ready)
+
+        self.gate("slow")
+        slow = asyncio.create_task(main.get_pool("slow"))
+        await asyncio.sleep(0)
+
+        pool = await asyncio.wait_for(main.get_pool("ready"), timeout=0.1)
+        self.assertIs(pool, ready)
+        self.assertFalse(slow.done())
+        slow.cancel()
+
+    async def test_caller_timeout_does_not_cancel_shared_connect(self):
+        gate = self.gate("a")
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(main.get_pool("a"), timeout=0.01)
+        self.assertNotIn("a", main.app.state.waiting)
+
+        waiter = asyncio.create_task(main.get_pool("a"))
+        await asyncio.sleep(0)
+        gate.set()
+        pool = await waiter
+
+        self.assertEqual(self.playwright.chromium.connects, ["a"])
+        self.assertEqual(pool.users, 1)
+
+    async def test_eviction_skips_busy_pools(self):
+        with mock.patch.object(main, "MAX_BROWSERS", 2):
+            busy = await main.get_pool("busy")
+            idle = await main.get_pool("idle")
+            main.release_pool(idle)
+
+            fresh = await main.get_pool("fresh")
+
+        self.assertEqual(list(main.app.state.pools), ["busy", "fresh"])
+        self.assertTrue(idle.browser.closed)
+        self.assertFalse(busy.browser.closed)
+        self.assertFalse(fresh.browser.closed)
+
+    async def test_pool_pinned_before_waiter_wakes(self):
+        # Both connects finish in the same tick: "b" must not evict "a"
+        # while a's caller is still waking up from the shield
+        gate_a, gate_b = self.gate("a"), self.gate("b")
+        with mock.patch.object(main, "MAX_BROWSERS", 1):
+            caller_a = asyncio.create_task(main.get_pool("a"))
+            caller_b = asyncio.create_task(main.get_pool("b"))
+            await asyncio.sleep(0)
+            gate_a.set()
+            gate_b.set()
+            pool_a, pool_b = await asyncio.gather(caller_a, caller_b)
+
+        self.assertFalse(pool_a.browser.closed)
+        self.assertFalse(pool_b.browser.closed)
+        self.assertEqual(pool_a.users, 1)
+
+if __name__ == "__main__":
+    unittest.main()